@@ -1,7 +1,15 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from io import BytesIO
 import datetime
+import hashlib
+import re
+import zipfile
+from xml.sax.saxutils import escape
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, Side
 
 # =====================================================
 # PAGE CONFIG
@@ -34,63 +42,57 @@ if not all([master_file, channel_file, customer_file]):
 # =====================================================
 # HELPERS
 # =====================================================
-def parse_percent(val):
-    if pd.isna(val):
-        return None
-    if isinstance(val, str):
-        return round(float(val.replace("%", "").replace(",", ".")), 1)
-    return round(float(val) * 100, 1)
-
-def parse_number(val):
-    if pd.isna(val):
-        return None
-    return round(float(val), 0)
-
-@st.cache_data(show_spinner=False)
-def load_sheet(file, sheet, key_col, val_col, _parser=None, skip=0):
-    df = pd.read_excel(file, sheet_name=sheet, skiprows=skip)
-    d = {}
-    for _, row in df.iterrows():
-        key = row[key_col]
-        val = row[val_col]
-        if _parser:
-            val = _parser(val)
-        d[key] = val
-    return d
+def parse_percent(s):
+    is_str = s.map(lambda x: isinstance(x, str))
+    out = pd.to_numeric(s.where(~is_str), errors="coerce") * 100
+    if is_str.any():
+        out[is_str] = pd.to_numeric(
+            s[is_str].str.replace("%", "", regex=False).str.replace(",", ".", regex=False),
+            errors="coerce"
+        )
+    return out.round(1)
+
+def parse_number(s):
+    return pd.to_numeric(s, errors="coerce").round(0)
+
+def file_digest(file_bytes):
+    return hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+
+def load_workbook(file):
+    sheet_names = sorted({spec[0] for spec in METRIC_SHEETS.values()})
+    return pd.read_excel(file, sheet_name=sheet_names, header=None, engine="calamine")
+
+def load_sheet(sheets, sheet, key_col, val_col, parser=None, skip=0):
+    raw = sheets[sheet]
+    df = raw.iloc[skip + 1:]
+    df.columns = raw.iloc[skip]
+    df = df.loc[:, ~df.columns.duplicated()]
+    df = df[df[key_col].notna()]
+    vals = df[val_col]
+    if parser:
+        vals = parser(vals)
+    return dict(zip(df[key_col].to_numpy(), vals.to_numpy()))
 
 # =====================================================
-# LOAD METRICS
+# METRIC SHEETS
 # =====================================================
-with st.spinner("🔄 Loading Channel Metrics..."):
-    channel_metrics = {
-        "cont": load_sheet(channel_file, "Sheet 18", "Customer P",
-                           "% of Total Current DO TP2 along Customer P, Customer P Hidden", _parser=parse_percent),
-        "mtd": load_sheet(channel_file, "Sheet 1", "Customer P", "Current DO", _parser=parse_number),
-        "ytd": load_sheet(channel_file, "Sheet 1", "Customer P", "Current DO TP2", _parser=parse_number),
-        "g_mtd": load_sheet(channel_file, "Sheet 4", "Customer P", "vs LY", _parser=parse_percent, skip=1),
-        "g_l3m": load_sheet(channel_file, "Sheet 3", "Customer P", "vs L3M", _parser=parse_percent, skip=1),
-        "g_ytd": load_sheet(channel_file, "Sheet 5", "Customer P", "vs LY", _parser=parse_percent, skip=1),
-        "a_mtd": load_sheet(channel_file, "Sheet 13", "Customer P", "Current Achievement", _parser=parse_percent),
-        "a_ytd": load_sheet(channel_file, "Sheet 14", "Customer P", "Current Achievement TP2", _parser=parse_percent),
-    }
-
-with st.spinner("🔄 Loading Customer Metrics..."):
-    customer_metrics = {
-        "cont": load_sheet(customer_file, "Sheet 18", "Customer P",
-                           "% of Total Current DO TP2 along Customer P, Customer P Hidden", _parser=parse_percent),
-        "mtd": load_sheet(customer_file, "Sheet 1", "Customer P", "Current DO", _parser=parse_number),
-        "ytd": load_sheet(customer_file, "Sheet 1", "Customer P", "Current DO TP2", _parser=parse_number),
-        "g_mtd": load_sheet(customer_file, "Sheet 4", "Customer P", "vs LY", _parser=parse_percent, skip=1),
-        "g_l3m": load_sheet(customer_file, "Sheet 3", "Customer P", "vs L3M", _parser=parse_percent, skip=1),
-        "g_ytd": load_sheet(customer_file, "Sheet 5", "Customer P", "vs LY", _parser=parse_percent, skip=1),
-        "a_mtd": load_sheet(customer_file, "Sheet 13", "Customer P", "Current Achievement", _parser=parse_percent),
-        "a_ytd": load_sheet(customer_file, "Sheet 14", "Customer P", "Current Achievement TP2", _parser=parse_percent),
-    }
+METRIC_SHEETS = {
+    "cont": ("Sheet 18", "Customer P",
+             "% of Total Current DO TP2 along Customer P, Customer P Hidden", parse_percent, 0),
+    "mtd": ("Sheet 1", "Customer P", "Current DO", parse_number, 0),
+    "ytd": ("Sheet 1", "Customer P", "Current DO TP2", parse_number, 0),
+    "g_mtd": ("Sheet 4", "Customer P", "vs LY", parse_percent, 1),
+    "g_l3m": ("Sheet 3", "Customer P", "vs L3M", parse_percent, 1),
+    "g_ytd": ("Sheet 5", "Customer P", "vs LY", parse_percent, 1),
+    "a_mtd": ("Sheet 13", "Customer P", "Current Achievement", parse_percent, 0),
+    "a_ytd": ("Sheet 14", "Customer P", "Current Achievement TP2", parse_percent, 0),
+}
 
-# =====================================================
-# LOAD MASTER
-# =====================================================
-master_df = pd.read_excel(master_file)
+@st.cache_data(show_spinner=False)
+def load_metrics(file_hash, _file_bytes):
+    sheets = load_workbook(BytesIO(_file_bytes))
+    metrics = {k: load_sheet(sheets, *spec) for k, spec in METRIC_SHEETS.items()}
+    return pd.DataFrame(metrics).reindex(list(metrics["mtd"])).fillna(0)
 
 # =====================================================
 # FLEXIBLE COLUMN MAPPING (CHANNEL & CUSTOMER)
@@ -115,12 +117,21 @@ def find_column(df, candidates):
             return c
     return None
 
+# =====================================================
+# LOAD MASTER
+# =====================================================
+@st.cache_data(show_spinner=False)
+def load_master(file_hash, _file_bytes):
+    df = pd.read_excel(BytesIO(_file_bytes), engine="calamine")
+    return df, find_column(df, CHANNEL_COL_CANDIDATES), find_column(df, CUSTOMER_COL_CANDIDATES)
+
+master_bytes = master_file.getvalue()
+master_hash = file_digest(master_bytes)
+master_df, channel_col, customer_col = load_master(master_hash, master_bytes)
+
 st.sidebar.divider()
 st.sidebar.header("🧩 Master Column Mapping")
 
-channel_col = find_column(master_df, CHANNEL_COL_CANDIDATES)
-customer_col = find_column(master_df, CUSTOMER_COL_CANDIDATES)
-
 all_cols = master_df.columns.tolist()
 
 if not channel_col:
@@ -155,40 +166,16 @@ with st.sidebar.expander("✅ Master Column Mapping (click to expand)", expanded
 # BUILD CHANNEL → CUSTOMER MAPPING
 # =====================================================
 with st.spinner("🔄 Building Channel → Customer mapping..."):
-    @st.cache_data
-    def build_channel_to_customers(df, ch_col, cust_col):
-        mapping = {}
-        for ch, g in df.groupby(ch_col):
-            customers = [str(c) if pd.notna(c) else "Data Kosong" for c in g[cust_col].unique()]
-            mapping[ch] = customers
-        return mapping
+    @st.cache_data(show_spinner=False)
+    def build_channel_to_customers(file_hash, _df, ch_col, cust_col):
+        channels = _df[ch_col].astype("category")
+        customers = _df[cust_col].astype("string").fillna("Data Kosong")
+        grouped = customers.groupby(channels, observed=True).unique()
+        return {ch: (sorted(custs.tolist()), frozenset(custs)) for ch, custs in grouped.items()}
 
-    channel_to_customers = build_channel_to_customers(master_df, channel_col, customer_col)
-
-# =====================================================
-# PRECOMPUTE METRICS ROWS
-# =====================================================
-with st.spinner("🔄 Precomputing Metrics rows..."):
-    @st.cache_data
-    def build_rows_dict(metrics_dict):
-        rows = {}
-        for key in metrics_dict["mtd"].keys():
-            row = [
-                metrics_dict["cont"].get(key),
-                metrics_dict["mtd"].get(key),
-                metrics_dict["ytd"].get(key),
-                metrics_dict["g_mtd"].get(key),
-                metrics_dict["g_l3m"].get(key),
-                metrics_dict["g_ytd"].get(key),
-                metrics_dict["a_mtd"].get(key),
-                metrics_dict["a_ytd"].get(key),
-            ]
-            row = [v if v is not None else 0 for v in row]
-            rows[key] = row
-        return rows
-
-    customer_rows_dict = build_rows_dict(customer_metrics)
-    channel_rows_dict = build_rows_dict(channel_metrics)
+    channel_to_customers = build_channel_to_customers(
+        master_hash, master_df, channel_col, customer_col
+    )
 
 # =====================================================
 # FILTER SECTION
@@ -222,11 +209,11 @@ selected_channels = st.sidebar.multiselect(
 )
 st.session_state["channel"] = selected_channels
 
-customers_filtered = []
-for ch in st.session_state["channel"]:
-    customers_filtered.extend(channel_to_customers.get(ch, []))
-
-normalized_customers = sorted(list(set([str(c) if pd.notna(c) else "Data Kosong" for c in customers_filtered])))
+if st.session_state["channel"]:
+    customers_filtered = np.concatenate([channel_to_customers[ch][0] for ch in st.session_state["channel"]])
+    normalized_customers = np.unique(customers_filtered).tolist()
+else:
+    normalized_customers = []
 
 old_customer_selection = st.session_state.get("customer", [])
 default_selection = [c for c in old_customer_selection if c in normalized_customers]
@@ -239,21 +226,44 @@ selected_customers_ui = st.sidebar.multiselect(
 )
 st.session_state["customer"] = selected_customers_ui
 
+if not st.session_state["channel"]:
+    st.info("ℹ️ Select at least one channel to build the report.")
+    st.stop()
+
+# =====================================================
+# LOAD METRICS
+# =====================================================
+with st.spinner("🔄 Loading Channel Metrics..."):
+    channel_bytes = channel_file.getvalue()
+    channel_metrics = load_metrics(file_digest(channel_bytes), channel_bytes)
+
+with st.spinner("🔄 Loading Customer Metrics..."):
+    customer_bytes = customer_file.getvalue()
+    customer_metrics = load_metrics(file_digest(customer_bytes), customer_bytes)
+
 # =====================================================
 # BUILD ROWS
 # =====================================================
-def build_row(label, metrics_dict, indent=False):
-    lbl = f"    {label}" if indent else label
-    return [lbl] + metrics_dict.get(label, [0]*8)
+selected_channels = st.session_state["channel"]
 
-rows = []
-rows.append(build_row("GRAND TOTAL", channel_rows_dict))
+channel_rows = channel_metrics.reindex(["GRAND TOTAL", *selected_channels], fill_value=0)
+channel_rows["_group"] = range(len(channel_rows))
 
-for ch in st.session_state["channel"]:
-    rows.append(build_row(ch, channel_rows_dict))
-    for cust in st.session_state["customer"]:
-        if cust in channel_to_customers.get(ch, []):
-            rows.append(build_row(cust, customer_rows_dict, indent=True))
+customer_pairs = [
+    (i, cust)
+    for i, ch in enumerate(selected_channels, start=1)
+    for cust in st.session_state["customer"]
+    if cust in channel_to_customers[ch][1]
+]
+customer_rows = customer_metrics.reindex([cust for _, cust in customer_pairs], fill_value=0)
+customer_rows.index = "    " + customer_rows.index.astype(str)
+customer_rows["_group"] = [i for i, _ in customer_pairs]
+
+rows_df = (
+    pd.concat([channel_rows, customer_rows])
+    .sort_values("_group", kind="stable")
+    .drop(columns="_group")
+)
 
 # =====================================================
 # DISPLAY TABLE
@@ -261,16 +271,18 @@ for ch in st.session_state["channel"]:
 st.subheader("📈 Performance Table (Filtered Preview)")
 st.caption(f"Data as of **{cutoff_str}**. Preview hanya baris yang dipilih filter.")
 
-display_df = pd.DataFrame(rows, columns=[
+REPORT_COLUMNS = [
     "Channel/Customer","Cont YTD","Value MTD","Value YTD",
     "Growth MTD","Growth %Gr L3M","Growth YTD","Ach MTD","Ach YTD"
-])
+]
 
-def fmt_pct(x):
-    return f"{x:.1f}%" if pd.notna(x) else "0%"
+display_df = rows_df.reset_index()
+display_df.columns = REPORT_COLUMNS
 
-for c in ["Cont YTD","Growth MTD","Growth %Gr L3M","Growth YTD","Ach MTD","Ach YTD"]:
-    display_df[c] = display_df[c].apply(fmt_pct)
+PCT_COLUMNS = ["Cont YTD","Growth MTD","Growth %Gr L3M","Growth YTD","Ach MTD","Ach YTD"]
+PCT_MASK = [c in PCT_COLUMNS for c in REPORT_COLUMNS[1:]]
+
+display_df[PCT_COLUMNS] = display_df[PCT_COLUMNS].astype(float).fillna(0).round(1).astype(str) + "%"
 
 st.dataframe(display_df, use_container_width=True)
 
@@ -280,40 +292,179 @@ st.dataframe(display_df, use_container_width=True)
 st.divider()
 st.subheader("⬇️ Export Full Report")
 
-output = BytesIO()
-with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-    wb = writer.book
-    ws = wb.add_worksheet("Report")
-    writer.sheets["Report"] = ws
-
-    header = wb.add_format({"bold": True,"align":"center","border":1})
-    bold = wb.add_format({"bold": True,"border":1})
-    ind = wb.add_format({"border":1,"indent":2,"font_color":"blue"})
-    num = wb.add_format({"border":1,"num_format":"#,##0"})
-    pct_g = wb.add_format({"border":1,"num_format":"0.0%","font_color":"green"})
-    pct_r = wb.add_format({"border":1,"num_format":"0.0%","font_color":"red"})
-
-    ws.write(0,0,f"Cut-off: {cutoff_str}",header)
-    ws.write_row(1,0,display_df.columns.tolist(),header)
-
-    for i, r in enumerate(rows,start=2):
-        name_fmt = ind if r[0].startswith("    ") else bold
-        ws.write(i,0,r[0].strip(),name_fmt)
-        for c in range(1,9):
-            v = r[c]
-            if c==1 or c>=4:
-                ws.write_number(i,c,v/100,pct_g if v>=0 else pct_r)
-            else:
-                ws.write_number(i,c,v or 0,num)
-
-    ws.set_column("A:A",50)
-    ws.set_column("B:I",18)
-
-output.seek(0)
+XML_ESCAPE_LITERAL = re.compile(r"(_x[0-9A-Fa-f]{4}_)")
+ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def clean_label(text):
+    # Excel's _xHHHH_ escaping, as the old xlsxwriter export did it: protect literal
+    # _xHHHH_ text first, then encode control characters and the \uFFFE/\uFFFF non-characters
+    text = XML_ESCAPE_LITERAL.sub(r"_x005F\1", str(text))
+    text = ILLEGAL_XML_CHARS.sub(lambda m: f"_x{ord(m.group()):04X}_", text)
+    return text.replace("\ufffe", "_xFFFE_").replace("\uffff", "_xFFFF_")
+
+thin = Side(style="thin")
+thin_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def build_xlsx(rows_df, cutoff_str):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Report")
+
+    def named_style(name, **kwargs):
+        wb.add_named_style(NamedStyle(name=name, border=thin_border, **kwargs))
+        return name
+
+    def styled(value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    header = named_style("header", font=Font(bold=True), alignment=Alignment(horizontal="center"))
+    bold = named_style("bold", font=Font(bold=True))
+    ind = named_style("ind", font=Font(color="0000FF"), alignment=Alignment(indent=2))
+    num = named_style("num", number_format="#,##0")
+    pct_g = named_style("pct_g", number_format="0.0%", font=Font(color="008000"))
+    pct_r = named_style("pct_r", number_format="0.0%", font=Font(color="FF0000"))
+
+    ws.column_dimensions["A"].width = 50
+    for col in "BCDEFGHI":
+        ws.column_dimensions[col].width = 18
+
+    ws.append([styled(f"Cut-off: {cutoff_str}", header)])
+    ws.append([styled(c, header) for c in REPORT_COLUMNS])
+
+    values = rows_df.to_numpy(dtype=float, copy=True)
+    values[:, PCT_MASK] /= 100
+
+    for label, vals in zip(rows_df.index, values.tolist()):
+        row = [styled(clean_label(label.strip()), ind if label.startswith("    ") else bold)]
+        row.extend(
+            styled(v, (pct_g if v >= 0 else pct_r) if is_pct else num)
+            for v, is_pct in zip(vals, PCT_MASK)
+        )
+        ws.append(row)
+
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+# ===== LARGE REPORTS: STREAM SHEET XML DIRECTLY =====
+LARGE_EXPORT_ROWS = 5000
+
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Report" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # cellXfs: 1 header, 2 bold, 3 ind, 4 num, 5 pct_g, 6 pct_r (same look as build_xlsx)
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="0.0%"/></numFmts>'
+        '<fonts count="5">'
+        '<font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font>'
+        '<font><sz val="11"/><color rgb="FF0000FF"/><name val="Calibri"/></font>'
+        '<font><sz val="11"/><color rgb="FF008000"/><name val="Calibri"/></font>'
+        '<font><sz val="11"/><color rgb="FFFF0000"/><name val="Calibri"/></font>'
+        '</fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="2"><border><left/><right/><top/><bottom/><diagonal/></border>'
+        '<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border>'
+        '</borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="7">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1">'
+        '<alignment horizontal="center"/></xf>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1"/>'
+        '<xf numFmtId="0" fontId="2" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1">'
+        '<alignment horizontal="left" indent="2"/></xf>'
+        '<xf numFmtId="3" fontId="0" fillId="0" borderId="1" xfId="0" applyNumberFormat="1" applyBorder="1"/>'
+        '<xf numFmtId="164" fontId="3" fillId="0" borderId="1" xfId="0" applyNumberFormat="1" applyFont="1" applyBorder="1"/>'
+        '<xf numFmtId="164" fontId="4" fillId="0" borderId="1" xfId="0" applyNumberFormat="1" applyFont="1" applyBorder="1"/>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<cols><col min="1" max="1" width="50" customWidth="1"/>'
+    '<col min="2" max="9" width="18" customWidth="1"/></cols>'
+    '<sheetData>'
+)
+SHEET_TAIL = '</sheetData></worksheet>'
+
+def xml_str_cell(ref, text, style):
+    return f'<c r="{ref}" s="{style}" t="inlineStr"><is><t xml:space="preserve">{escape(clean_label(text))}</t></is></c>'
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def stream_xlsx(rows_df, cutoff_str):
+    cols = "ABCDEFGHI"
+    values = rows_df.to_numpy(dtype=float, copy=True)
+    values[:, PCT_MASK] /= 100
+
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in XLSX_PARTS.items():
+            zf.writestr(name, xml)
+
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            parts = [SHEET_HEAD]
+            parts.append(f'<row r="1">{xml_str_cell("A1", f"Cut-off: {cutoff_str}", 1)}</row>')
+            parts.append('<row r="2">' + "".join(
+                xml_str_cell(f"{col}2", name, 1) for col, name in zip(cols, REPORT_COLUMNS)
+            ) + "</row>")
+
+            for i, (label, vals) in enumerate(zip(rows_df.index, values.tolist()), start=3):
+                cells = [xml_str_cell(f"A{i}", label.strip(), 3 if label.startswith("    ") else 2)]
+                for col, v, is_pct in zip(cols[1:], vals, PCT_MASK):
+                    style = (5 if v >= 0 else 6) if is_pct else 4
+                    cells.append(f'<c r="{col}{i}" s="{style}"><v>{v}</v></c>')
+                parts.append(f'<row r="{i}">{"".join(cells)}</row>')
+
+                if len(parts) >= 1000:
+                    sheet.write("".join(parts).encode())
+                    parts = []
+
+            parts.append(SHEET_TAIL)
+            sheet.write("".join(parts).encode())
+
+    return output.getvalue()
 
 st.download_button(
     "📥 Download Excel Report",
-    output,
+    (build_xlsx if len(rows_df) <= LARGE_EXPORT_ROWS else stream_xlsx)(rows_df, cutoff_str),
     "Channel & Customer Group Report.xlsx",
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 ) 